@@ -1,3 +1,10 @@
+from __future__ import annotations
+import array
+import itertools
+import operator
+
+from typing import Iterable, NamedTuple, Tuple
+
 from lib import read_input, timer
 
 
@@ -50,6 +57,118 @@ def count_safe_reports_dampened(
     return safe_count
 
 
+class FlatReports(NamedTuple):
+    """
+    All report levels in one buffer, with report k spanning
+    levels[offsets[k] : offsets[k + 1]]
+    """
+
+    levels: array.array[int]
+    offsets: array.array[int]
+
+
+def parse_flat_reports() -> FlatReports:
+    levels = array.array('l')
+    offsets = array.array('l', [0])
+    for line in read_input(2):
+        levels.extend(int(n) for n in line.split(' '))
+        offsets.append(len(levels))
+    return FlatReports(levels, offsets)
+
+
+def flat_intervals(levels: array.array[int]) -> array.array[int]:
+    """
+    Interval k is levels[k + 1] - levels[k]. Intervals that straddle two
+    reports are computed too, but never read.
+    """
+    return array.array(
+        'l', map(operator.sub, itertools.islice(levels, 1, None), levels)
+    )
+
+
+def unsafe_prefix_counts(
+    intervals: Iterable[int], lo: int, hi: int
+) -> array.array[int]:
+    """
+    Entry k counts the intervals before k that fall outside [lo, hi], so the
+    unsafe intervals in [a, b) are counts[b] - counts[a]
+    """
+    return array.array(
+        'l',
+        itertools.accumulate(
+            (not lo <= step <= hi for step in intervals), initial=0
+        ),
+    )
+
+
+def step_bounds(min_step: int, max_step: int) -> Tuple[Tuple[int, int], ...]:
+    return ((min_step, max_step), (-max_step, -min_step))
+
+
+def count_safe_flat_reports(
+    reports: FlatReports, min_step: int, max_step: int
+) -> int:
+    intervals = flat_intervals(reports.levels)
+    unsafe_counts = [
+        unsafe_prefix_counts(intervals, lo, hi)
+        for lo, hi in step_bounds(min_step, max_step)
+    ]
+
+    safe_count = 0
+    for start, end in itertools.pairwise(reports.offsets):
+        last = end - 1
+        if any(unsafe[last] == unsafe[start] for unsafe in unsafe_counts):
+            safe_count += 1
+
+    return safe_count
+
+
+def is_dampened_safe(
+    levels: array.array[int],
+    unsafe: array.array[int],
+    start: int,
+    end: int,
+    lo: int,
+    hi: int,
+) -> bool:
+    last = end - 1
+    if unsafe[last] == unsafe[start] or unsafe[last] == unsafe[start + 1]:
+        return True   # Already safe, or safe without the first level
+    if unsafe[last - 1] == unsafe[start]:
+        return True   # Safe without the last level
+
+    for i in range(start + 1, last):
+        # Dropping level i merges the intervals on either side of it
+        if (
+            unsafe[i - 1] == unsafe[start]
+            and unsafe[last] == unsafe[i + 1]
+            and lo <= levels[i + 1] - levels[i - 1] <= hi
+        ):
+            return True
+
+    return False
+
+
+def count_safe_flat_reports_dampened(
+    reports: FlatReports, min_step: int, max_step: int
+) -> int:
+    intervals = flat_intervals(reports.levels)
+    bounds = [
+        (unsafe_prefix_counts(intervals, lo, hi), lo, hi)
+        for lo, hi in step_bounds(min_step, max_step)
+    ]
+
+    safe_count = 0
+    for start, end in itertools.pairwise(reports.offsets):
+        if any(
+            is_dampened_safe(reports.levels, unsafe, start, end, lo, hi)
+            for unsafe, lo, hi in bounds
+        ):
+            safe_count += 1
+
+    return safe_count
+
+
 if __name__ == '__main__':
     reports = parse_reports()
 
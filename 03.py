@@ -1,6 +1,9 @@
+import functools
+import os
 import re
 
-from typing import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional, Tuple
 
 from lib import read_input, timer
 
@@ -53,6 +56,142 @@ def sum_enabled_mul_results(
     return result
 
 
+MUL_BYTES_PATTERN = re.compile(rb'(?P<instr>mul)\((?P<l>\d+),(?P<r>\d+)\)')
+DO_DONT_MUL_BYTES_PATTERN = re.compile(
+    rb"(?P<instr>do|don't|mul)\(((?P<l>\d+),(?P<r>\d+))?\)"
+)
+
+# Matches a trailing fragment that may still become an instruction once more
+# bytes arrive. None of these fragments contain an 'm', 'd' or ')' past their
+# first byte, so the only candidate start is the last 'm' or 'd' in a buffer,
+# and it can never overlap an instruction that was already matched.
+PARTIAL_INSTRUCTION_PATTERN = re.compile(
+    rb"(?:(?:mul|do|don't)(?:\((?:\d+(?:,\d*)?)?)?|m|mu|d|don|don')\Z"
+)
+
+
+def run_instructions(
+    instruction_matches: Iterable[re.Match[bytes]], enabled: bool
+) -> Tuple[int, bool]:
+    result = 0
+    for m in instruction_matches:
+        instr = m.group('instr')
+        if instr == b'mul':
+            if enabled and m.group('l') is not None:
+                result += int(m.group('l')) * int(m.group('r'))
+        elif instr == b'do':
+            enabled = True
+        elif instr == b"don't":
+            enabled = False
+
+    return result, enabled
+
+
+def partial_instruction_start(buffer: bytes) -> int:
+    candidate = max(buffer.rfind(b'm'), buffer.rfind(b'd'))
+    if candidate >= 0 and PARTIAL_INSTRUCTION_PATTERN.match(buffer, candidate):
+        return candidate
+    return len(buffer)
+
+
+def scan_memory_stream(
+    memory: BinaryIO, do_dont: bool, chunk_size: int = 1 << 16
+) -> Iterator[int]:
+    """
+    Reads memory in fixed-size chunks and yields the running result after
+    each one. The unfinished instruction at the end of a chunk, if any, is
+    carried over and rescanned with the next chunk.
+    """
+    pattern = DO_DONT_MUL_BYTES_PATTERN if do_dont else MUL_BYTES_PATTERN
+
+    result = 0
+    enabled = True
+    tail = b''
+    while chunk := memory.read(chunk_size):
+        buffer = tail + chunk
+        chunk_result, enabled = run_instructions(
+            pattern.finditer(buffer), enabled
+        )
+        result += chunk_result
+        tail = buffer[partial_instruction_start(buffer) :]
+        yield result
+
+
+class SegmentSummary(NamedTuple):
+    enabled_result: int   # Result if the segment starts enabled
+    disabled_result: int   # Result if the segment starts disabled
+    final_state: Optional[bool]   # None if the segment has no do or don't
+
+
+def summarise_segment(segment: bytes, do_dont: bool) -> SegmentSummary:
+    pattern = DO_DONT_MUL_BYTES_PATTERN if do_dont else MUL_BYTES_PATTERN
+
+    enabled_result = 0
+    disabled_result = 0
+    final_state: Optional[bool] = None
+    for m in pattern.finditer(segment):
+        instr = m.group('instr')
+        if instr == b'mul' and m.group('l') is not None:
+            product = int(m.group('l')) * int(m.group('r'))
+            if final_state is None or final_state:
+                enabled_result += product
+            if final_state:
+                disabled_result += product
+        elif instr == b'do':
+            final_state = True
+        elif instr == b"don't":
+            final_state = False
+
+    return SegmentSummary(enabled_result, disabled_result, final_state)
+
+
+def safe_segment_cut(memory: bytes, cut: int, do_dont: bool) -> int:
+    """
+    Moves cut back to the start of the instruction straddling it, if any.
+    Instructions hold no 'm' or 'd' past their first byte, so a straddling
+    instruction can only start at the last 'm' or 'd' before the cut.
+    """
+    pattern = DO_DONT_MUL_BYTES_PATTERN if do_dont else MUL_BYTES_PATTERN
+    candidate = max(memory.rfind(b'm', 0, cut), memory.rfind(b'd', 0, cut))
+    if candidate >= 0:
+        m = pattern.match(memory, candidate)
+        if m and m.end() > cut:
+            return candidate
+    return cut
+
+
+def sum_mul_results_parallel(
+    memory: bytes, do_dont: bool, workers: Optional[int] = None
+) -> int:
+    workers = workers or os.cpu_count() or 1
+    segment_size = -(-len(memory) // workers)
+    cuts = [0]
+    for k in range(1, workers):
+        cut = min(k * segment_size, len(memory))
+        cuts.append(max(cuts[-1], safe_segment_cut(memory, cut, do_dont)))
+    cuts.append(len(memory))
+    segments = [memory[start:end] for start, end in zip(cuts, cuts[1:])]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        summaries = list(
+            executor.map(
+                functools.partial(summarise_segment, do_dont=do_dont),
+                segments,
+            )
+        )
+
+    result = 0
+    enabled = True
+    for summary in summaries:
+        result += (
+            summary.enabled_result if enabled else summary.disabled_result
+        )
+        if summary.final_state is not None:
+            enabled = summary.final_state
+
+    return result
+
+
 if __name__ == '__main__':
     memory = read_memory()
     print('Day 3, Part 1')
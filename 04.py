@@ -1,4 +1,9 @@
-from typing import Tuple, TypeAlias
+import functools
+import os
+
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, Tuple, TypeAlias
 
 from lib import read_input, timer
 
@@ -86,6 +91,225 @@ def count_all_x_mas(puzzle: WordSearch) -> int:
     return count
 
 
+class WordAutomaton:
+    """
+    Aho-Corasick automaton that counts every occurrence of every word in a
+    single pass over a line
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self.words = list(dict.fromkeys(words))
+        assert all(self.words)
+
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[int]] = [[]]
+        for w, word in enumerate(self.words):
+            state = 0
+            for letter in word:
+                if letter not in self._goto[state]:
+                    self._goto[state][letter] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = self._goto[state][letter]
+            self._output[state].append(w)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for letter, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and letter not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(letter, 0)
+                self._output[next_state].extend(
+                    self._output[self._fail[next_state]]
+                )
+
+    def count(self, line: str, counts: list[int]) -> None:
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for letter in line:
+            while state and letter not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(letter, 0)
+            for w in output[state]:
+                counts[w] += 1
+
+
+def puzzle_lines(puzzle: WordSearch) -> Iterator[str]:
+    """
+    Every row, column, diagonal and anti-diagonal of the puzzle, read in one
+    direction. Reversing each line covers the other four directions.
+    """
+    ROWS = len(puzzle)
+    COLS = len(puzzle[0])
+
+    for row in puzzle:
+        yield ''.join(row)
+
+    for j in range(COLS):
+        yield ''.join(puzzle[i][j] for i in range(ROWS))
+
+    for d in range(-(ROWS - 1), COLS):
+        yield ''.join(
+            puzzle[i][i + d] for i in range(max(0, -d), min(ROWS, COLS - d))
+        )
+
+    for s in range(ROWS + COLS - 1):
+        yield ''.join(
+            puzzle[i][s - i]
+            for i in range(max(0, s - COLS + 1), min(ROWS, s + 1))
+        )
+
+
+def count_all_words(
+    puzzle: WordSearch, words: Iterable[str]
+) -> dict[str, int]:
+    automaton = WordAutomaton(words)
+    counts = [0] * len(automaton.words)
+    for line in puzzle_lines(puzzle):
+        automaton.count(line, counts)
+        automaton.count(line[::-1], counts)
+
+    return dict(zip(automaton.words, counts))
+
+
+@functools.cache
+def letter_table(letter: str) -> bytes:
+    return bytes(int(b == ord(letter)) for b in range(256))
+
+
+def diagonal_mask(
+    rows: list[bytes], words: Iterable[str], i: int, width: int, slope: int
+) -> int:
+    """
+    Bitmask with one byte per candidate centre in row i, set to 1 where the
+    diagonal through the centre reads one of the words. A slope of +1 is the
+    top-left to bottom-right diagonal, -1 the top-right to bottom-left one.
+    """
+    mask = 0
+    for word in words:
+        k = len(word) // 2
+        word_mask = -1
+        for t, letter in enumerate(word):
+            start = k + slope * (t - k)
+            row = rows[i + t - k][start : start + width]
+            word_mask &= int.from_bytes(row.translate(letter_table(letter)))
+        mask |= word_mask
+    return mask
+
+
+def count_crosses(
+    puzzle: WordSearch, down_right: Iterable[str], down_left: Iterable[str]
+) -> int:
+    """
+    Counts cells at the centre of an X whose top-left to bottom-right
+    diagonal reads one of down_right and whose top-right to bottom-left
+    diagonal reads one of down_left. All words must share one odd length.
+    """
+    down_right = list(down_right)
+    down_left = list(down_left)
+    lengths = set(len(word) for word in down_right + down_left)
+    assert len(lengths) == 1
+    length = lengths.pop()
+    assert length % 2 == 1
+    k = length // 2
+
+    rows = [''.join(row).encode() for row in puzzle]
+    width = len(rows[0]) - 2 * k
+    if width <= 0:
+        return 0
+
+    count = 0
+    for i in range(k, len(rows) - k):
+        mask = diagonal_mask(rows, down_right, i, width, +1)
+        if mask:
+            mask &= diagonal_mask(rows, down_left, i, width, -1)
+        count += mask.bit_count()
+
+    return count
+
+
+def count_all_x_mas_shifted(puzzle: WordSearch) -> int:
+    return count_crosses(puzzle, ('MAS', 'SAM'), ('MAS', 'SAM'))
+
+
+def band_starts(puzzle: WordSearch, workers: int) -> range:
+    band_size = -(-len(puzzle) // workers)
+    return range(0, len(puzzle), band_size)
+
+
+def count_band_words(
+    band: WordSearch, own_rows: int, words: list[str]
+) -> Counter[str]:
+    """
+    Counts the words whose topmost letter lies in the first own_rows rows.
+    The rows after those are the halo, and any word that fits entirely in
+    the halo belongs to the next band, so it is subtracted back out.
+    """
+    counts = Counter(count_all_words(band, words))
+    halo = band[own_rows:]
+    if halo:
+        counts.subtract(count_all_words(halo, words))
+    return counts
+
+
+def count_all_words_parallel(
+    puzzle: WordSearch, words: Iterable[str], workers: Optional[int] = None
+) -> dict[str, int]:
+    words = list(words)
+    workers = workers or os.cpu_count() or 1
+    halo = max(len(word) for word in words) - 1
+
+    starts = band_starts(puzzle, workers)
+    bands = [puzzle[start : start + starts.step + halo] for start in starts]
+    own_rows = [min(starts.step, len(puzzle) - start) for start in starts]
+
+    counts: Counter[str] = Counter(dict.fromkeys(words, 0))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for band_counts in executor.map(
+            functools.partial(count_band_words, words=words), bands, own_rows
+        ):
+            counts.update(band_counts)
+
+    return dict(counts)
+
+
+def count_crosses_parallel(
+    puzzle: WordSearch,
+    down_right: Iterable[str],
+    down_left: Iterable[str],
+    workers: Optional[int] = None,
+) -> int:
+    """
+    Each band is padded with half a word of rows above and below, and
+    count_crosses only counts centres with that much room on both sides, so
+    every centre is counted by exactly one band.
+    """
+    down_right = list(down_right)
+    down_left = list(down_left)
+    workers = workers or os.cpu_count() or 1
+    k = len(down_right[0]) // 2
+
+    starts = band_starts(puzzle, workers)
+    bands = [
+        puzzle[max(0, start - k) : start + starts.step + k] for start in starts
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(
+            executor.map(
+                functools.partial(
+                    count_crosses, down_right=down_right, down_left=down_left
+                ),
+                bands,
+            )
+        )
+
+
 if __name__ == '__main__':
     puzzle = parse_puzzle()
     print('Day 4, Part 1')
@@ -1,7 +1,7 @@
 from __future__ import annotations
-import copy
+import functools
 
-from collections import defaultdict
+from collections import defaultdict, deque
 from typing import Iterable, NamedTuple, NewType
 
 from lib import read_input, timer
@@ -25,6 +25,21 @@ class Printer:
             self.numbers_after[rule.l].add(rule.r)
             self.numbers_before[rule.r].add(rule.l)
 
+        # Rules compiled to bitmasks, with one bit per page named in a rule
+        self.page_bits = {
+            n: 1 << b
+            for b, n in enumerate(
+                sorted(self.numbers_after.keys() | self.numbers_before.keys())
+            )
+        }
+        self.after_masks = {
+            n: self.page_mask(after) for n, after in self.numbers_after.items()
+        }
+        self.before_masks = {
+            n: self.page_mask(before)
+            for n, before in self.numbers_before.items()
+        }
+
     @staticmethod
     def from_input(input: Iterable[str]) -> Printer:
         rules = []
@@ -40,15 +55,22 @@ class Printer:
 
         return Printer(rules, updates)
 
+    def page_mask(self, pages: Iterable[int]) -> int:
+        mask = 0
+        for n in pages:
+            mask |= self.page_bits.get(n, 0)
+        return mask
+
     def validate_update(self, update: Update) -> bool:
-        for i, n in enumerate(update):
-            before_n = set(update[:i])
-            after_n = set(update[i + 1 :])
-            if (
-                self.numbers_after[n] & before_n
-                or self.numbers_before[n] & after_n
-            ):
+        """
+        Every broken rule has its later page seen before its earlier one, so
+        one scan checking each page against the pages already seen suffices
+        """
+        seen = 0
+        for n in update:
+            if self.after_masks.get(n, 0) & seen:
                 return False
+            seen |= self.page_bits.get(n, 0)
 
         return True
 
@@ -62,22 +84,44 @@ class Printer:
             update[len(update) // 2] for update in self.validate_updates()
         )
 
+    def compare_pages(self, l: int, r: int) -> int:
+        if r in self.numbers_after[l]:
+            return -1
+        if l in self.numbers_after[r]:
+            return 1
+        return 0
+
     def repair_update(self, broken_update: Update) -> Update:
-        update = copy.copy(broken_update)
-        while not self.validate_update(update):
-            for i, n in enumerate(update):
-                misplaced_before = self.numbers_after[n] & set(update[:i])
-                misplaced_after = self.numbers_before[n] & set(update[i + 1 :])
-
-                if misplaced_before:
-                    misplaced_index = update.index(misplaced_before.pop())
-                    update.insert(i + 1, update.pop(misplaced_index))
-                    break
-
-                elif misplaced_after:
-                    misplaced_index = update.index(misplaced_after.pop())
-                    update.insert(i, update.pop(misplaced_index))
-                    break
+        """
+        Sorting by the rules is only sound when they totally order the
+        update's pages, so anything else falls back to a topological sort
+        """
+        update = Update(
+            sorted(broken_update, key=functools.cmp_to_key(self.compare_pages))
+        )
+        if self.validate_update(update):
+            return update
+
+        return self.topological_repair(broken_update)
+
+    def topological_repair(self, broken_update: Update) -> Update:
+        pages = set(broken_update)
+        blockers = {
+            n: len(self.numbers_before[n] & pages) for n in broken_update
+        }
+        ready = deque(n for n in broken_update if not blockers[n])
+
+        update = Update([])
+        while ready:
+            n = ready.popleft()
+            update.append(n)
+            for m in self.numbers_after[n] & pages:
+                blockers[m] -= 1
+                if not blockers[m]:
+                    ready.append(m)
+
+        if len(update) != len(broken_update):
+            raise ValueError(f'Rules for {broken_update} contain a cycle')
 
         return update
 
@@ -88,9 +132,29 @@ class Printer:
             if not self.validate_update(update)
         )
 
+    def repaired_middle_page(self, broken_update: Update) -> int:
+        """
+        A page ordered against every other page of the update by the rules
+        has a fixed place in any repair, given by its predecessor count
+        """
+        update_mask = self.page_mask(broken_update)
+        middle = len(broken_update) // 2
+        for n in broken_update:
+            predecessors = self.before_masks.get(n, 0) & update_mask
+            successors = self.after_masks.get(n, 0) & update_mask
+            if (
+                predecessors.bit_count() == middle
+                and successors.bit_count() == len(broken_update) - middle - 1
+            ):
+                return n
+
+        return self.repair_update(broken_update)[middle]
+
     def score_repaired_updates(self) -> int:
         return sum(
-            update[len(update) // 2] for update in self.repair_updates()
+            self.repaired_middle_page(update)
+            for update in self.updates
+            if not self.validate_update(update)
         )
 
 
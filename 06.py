@@ -1,7 +1,10 @@
 from __future__ import annotations
+import bisect
 import copy
+import os
 
-from typing import Iterable, Literal, NamedTuple, Self, Union
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Literal, Optional, Self, Tuple, Union
 
 from lib import read_input, timer
 
@@ -32,33 +35,65 @@ class Pos:
         return f'Pos({self.i}, {self.j})'
 
 
-class History(NamedTuple):
-    position: Pos
-    orientation: Pos
+class VisitedStates:
+    """
+    One byte per (position, orientation index) state, at cell * 4 +
+    orientation. A state is visited when its byte holds the current stamp,
+    so clearing only bumps the stamp and the buffer is reused.
+    """
+
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self._states = bytearray(rows * cols * 4)
+        self._stamp = 1
+
+    def add(self, i: int, j: int, direction: int) -> None:
+        self._states[(i * self.cols + j) * 4 + direction] = self._stamp
+
+    def seen(self, i: int, j: int, direction: int) -> bool:
+        if not 0 <= i < self.rows or not 0 <= j < self.cols:
+            return False
+        return self._states[(i * self.cols + j) * 4 + direction] == self._stamp
+
+    def clear(self) -> None:
+        self._stamp += 1
+        if self._stamp > 255:
+            self._states[:] = bytes(len(self._states))
+            self._stamp = 1
+
+    def positions(self) -> Iterator[Pos]:
+        for cell in range(self.rows * self.cols):
+            if self._stamp in self._states[cell * 4 : cell * 4 + 4]:
+                yield Pos(*divmod(cell, self.cols))
 
 
 class Guard:
     orientations = [Pos(-1, 0), Pos(0, 1), Pos(1, 0), Pos(0, -1)]
 
-    def __init__(self, position: Pos, facing: Pos):
+    def __init__(self, position: Pos, facing: Pos, visited: VisitedStates):
         self.position: Pos = position
-        self.orientation: Pos = facing
-        self.history: set[History] = set()
+        self.direction: int = Guard.orientations.index(facing)
+        self.visited = visited
+
+    @property
+    def orientation(self) -> Pos:
+        return Guard.orientations[self.direction]
 
     def next_position(self) -> Pos:
         return self.position + self.orientation
 
     def move(self, next_position: Pos) -> None:
-        self.history.add(History(self.position, self.orientation))
+        self.visited.add(self.position.i, self.position.j, self.direction)
         self.position = next_position
 
     def turn(self) -> None:
-        current_orientation = Guard.orientations.index(self.orientation)
-        next_orientation = (current_orientation + 1) % len(Guard.orientations)
-        self.orientation = Guard.orientations[next_orientation]
+        self.direction = (self.direction + 1) % len(Guard.orientations)
 
     def has_looped(self) -> bool:
-        return History(self.position, self.orientation) in self.history
+        return self.visited.seen(
+            self.position.i, self.position.j, self.direction
+        )
 
 
 class Map:
@@ -97,11 +132,72 @@ class Map:
         return contains
 
 
+class ObstacleIndex:
+    """
+    Sorted obstacle columns per row and obstacle rows per column, so the
+    guard can jump straight to the next obstacle in any direction
+    """
+
+    def __init__(self, map: Map):
+        self.rows: list[list[int]] = [[] for _ in range(map.max_row + 1)]
+        self.cols: list[list[int]] = [[] for _ in range(map.max_col + 1)]
+        for i in range(map.max_row + 1):
+            for j in range(map.max_col + 1):
+                if map[Pos(i, j)] == '#':
+                    self.rows[i].append(j)
+                    self.cols[j].append(i)
+
+    def next_stop(
+        self, i: int, j: int, direction: int, extra: Optional[Pos]
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Where a guard at (i, j) facing Guard.orientations[direction] stops
+        before turning, or None if it walks off the map. An extra obstacle
+        not in the index can be given.
+        """
+        if direction == 0:   # Up
+            col = self.cols[j]
+            k = bisect.bisect_left(col, i)
+            stop = col[k - 1] if k else None
+            if extra and extra.j == j and extra.i < i:
+                stop = extra.i if stop is None else max(stop, extra.i)
+            return None if stop is None else (stop + 1, j)
+
+        elif direction == 1:   # Right
+            row = self.rows[i]
+            k = bisect.bisect_right(row, j)
+            stop = row[k] if k < len(row) else None
+            if extra and extra.i == i and extra.j > j:
+                stop = extra.j if stop is None else min(stop, extra.j)
+            return None if stop is None else (i, stop - 1)
+
+        elif direction == 2:   # Down
+            col = self.cols[j]
+            k = bisect.bisect_right(col, i)
+            stop = col[k] if k < len(col) else None
+            if extra and extra.j == j and extra.i > i:
+                stop = extra.i if stop is None else min(stop, extra.i)
+            return None if stop is None else (stop - 1, j)
+
+        else:   # Left
+            row = self.rows[i]
+            k = bisect.bisect_left(row, j)
+            stop = row[k - 1] if k else None
+            if extra and extra.i == i and extra.j < j:
+                stop = extra.j if stop is None else max(stop, extra.j)
+            return None if stop is None else (i, stop + 1)
+
+
+GuardState = Tuple[int, int, int]   # Row, column, orientation index
+
+
 class World:
     def __init__(self, map: Map, guard: Guard):
         self.map = map
         self.starting_guard = copy.copy(guard)
         self.guard = guard
+        self.obstacle_index = ObstacleIndex(map)
+        self.turns = VisitedStates(map.max_row + 1, map.max_col + 1)
 
     @staticmethod
     def from_input(input: Iterable[str]) -> World:
@@ -115,7 +211,8 @@ class World:
 
         assert len(map_grid) and len(map_grid[0])
         assert guard_pos
-        return World(Map(map_grid), Guard(guard_pos, Pos(-1, 0)))
+        visited = VisitedStates(len(map_grid), len(map_grid[0]))
+        return World(Map(map_grid), Guard(guard_pos, Pos(-1, 0), visited))
 
     def play(self) -> Union[Literal['EXIT'], Literal['LOOP'], None]:
         while (
@@ -137,29 +234,131 @@ class World:
 
     def reset(self) -> None:
         self.map.reset()
+        self.guard.visited.clear()
         self.guard = Guard(
-            self.starting_guard.position, self.starting_guard.orientation
+            self.starting_guard.position,
+            self.starting_guard.orientation,
+            self.guard.visited,
         )
 
     def count_guard_positions(self) -> int:
-        return len(set([history.position for history in self.guard.history]))
+        return sum(1 for _ in self.guard.visited.positions())
+
+    def starting_state(self) -> GuardState:
+        return (
+            self.starting_guard.position.i,
+            self.starting_guard.position.j,
+            self.starting_guard.direction,
+        )
+
+    def guard_loops(
+        self,
+        extra_obstacle: Optional[Pos] = None,
+        start: Optional[GuardState] = None,
+        route_turns: Optional[VisitedStates] = None,
+    ) -> bool:
+        """
+        Walks the guard leg by leg, remembering only the states it turns
+        in. The guard loops once it turns in the same state twice, or in
+        any of route_turns, the turns already made on its way to start.
+        """
+        i, j, direction = start or self.starting_state()
+
+        turns = self.turns
+        turns.clear()
+        while True:
+            stop = self.obstacle_index.next_stop(
+                i, j, direction, extra_obstacle
+            )
+            if stop is None:
+                return False
+
+            i, j = stop
+            if turns.seen(i, j, direction) or (
+                route_turns is not None and route_turns.seen(i, j, direction)
+            ):
+                return True
+            turns.add(i, j, direction)
+            direction = (direction + 1) % len(Guard.orientations)
+
+    def walk_route(
+        self, route_turns: VisitedStates
+    ) -> Iterator[Tuple[Pos, GuardState]]:
+        """
+        Walks the guard's original route from the starting state, yielding
+        each cell it reaches for the first time with the state just before
+        it. Turns made so far are recorded in route_turns.
+        """
+        i, j, direction = self.starting_state()
+        visited = {(i, j)}
+
+        while True:
+            orientation = Guard.orientations[direction]
+            next_pos = Pos(i + orientation.i, j + orientation.j)
+            next_tile = self.map[next_pos]
+            if next_tile == ' ':
+                return
+
+            if next_tile == '#':
+                if route_turns.seen(i, j, direction):
+                    raise ValueError('Guard loops without an extra obstacle')
+                route_turns.add(i, j, direction)
+                direction = (direction + 1) % len(Guard.orientations)
+                continue
+
+            if (next_pos.i, next_pos.j) not in visited:
+                visited.add((next_pos.i, next_pos.j))
+                yield next_pos, (i, j, direction)
+
+            i, j = next_pos.i, next_pos.j
+
+    def loop_candidates(self) -> list[Pos]:
+        route_turns = VisitedStates(len(self.map), self.map.max_col + 1)
+        return [pos for pos, _ in self.walk_route(route_turns)]
 
     def count_possible_loops(self) -> int:
+        return count_loops(self, self.loop_candidates())
+
+    def count_possible_loops_parallel(
+        self, workers: Optional[int] = None
+    ) -> int:
+        workers = workers or os.cpu_count() or 1
+        candidates = self.loop_candidates()
+        chunk_size = -(-len(candidates) // workers) or 1
+        chunks = [
+            candidates[k : k + chunk_size]
+            for k in range(0, len(candidates), chunk_size)
+        ]
+
+        # Workers only need the map and where the guard starts
+        world = World(
+            self.map,
+            Guard(
+                self.starting_guard.position,
+                self.starting_guard.orientation,
+                VisitedStates(len(self.map), self.map.max_col + 1),
+            ),
+        )
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return sum(
+                executor.map(count_loops, [world] * len(chunks), chunks)
+            )
+
+    def count_possible_loops_resumed(self) -> int:
         """
-        Should be run after world.play() has run and guard position history exists
+        Walks the guard's original route once. Each cell on it is tried as
+        an obstacle from the state just before the guard first reaches it,
+        since the route up to there is unchanged by the obstacle.
         """
-        guard_position_history = set(
-            history.position for history in self.guard.history
+        route_turns = VisitedStates(len(self.map), self.map.max_col + 1)
+        return sum(
+            self.guard_loops(pos, state, route_turns)
+            for pos, state in self.walk_route(route_turns)
         )
-        loops = 0
-        for pos in guard_position_history:
-            world.reset()
-            if pos != self.starting_guard.position:
-                self.map.place_obstacle(pos)
-            status = world.play()
-            if status == 'LOOP':
-                loops += 1
-        return loops
+
+
+def count_loops(world: World, candidates: list[Pos]) -> int:
+    return sum(world.guard_loops(pos) for pos in candidates)
 
 
 if __name__ == '__main__':
@@ -172,6 +371,6 @@ if __name__ == '__main__':
     print(f'Result: {result}\n')    # 5318
 
     print('Day 6, Part 2')
-    with timer():   # Takes about 30 seconds to run
+    with timer():
         result = world.count_possible_loops()
     print(f'Result: {result}\n')    # 1831
@@ -1,7 +1,19 @@
 import functools
+import heapq
+import itertools
 import math
-
-from typing import Callable, Iterable, NamedTuple, Tuple, TypeAliasType
+import operator
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Callable,
+    Iterable,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeAliasType,
+)
 
 from lib import read_input, timer
 
@@ -65,15 +77,152 @@ def concatenate(numbers: Iterable[int]) -> int:
     return int(''.join(str(num) for num in numbers))
 
 
+def subtract(total: int, num: int) -> Optional[int]:
+    return total - num if total >= num else None
+
+
+def divide(total: int, num: int) -> Optional[int]:
+    return total // num if num and total % num == 0 else None
+
+
+def decimal_place(num: int) -> int:
+    place = 10
+    while place <= num:
+        place *= 10
+    return place
+
+
+def concatenate_pair(l: int, r: int) -> int:
+    return l * decimal_place(r) + r
+
+
+def strip_suffix(total: int, num: int) -> Optional[int]:
+    place = decimal_place(num)
+    return total // place if total % place == num else None
+
+
+class OperatorInfo(NamedTuple):
+    apply: Callable[[int, int], int]
+    # Undoes the operator given its result and right operand, or returns
+    # None if no operand could have produced the result
+    inverse: Optional[Callable[[int, int], Optional[int]]]
+    # Never returns less than its left operand, given positive operands
+    monotonic: bool
+
+
+OPERATORS: dict[Callable[[Iterable[int]], int], OperatorInfo] = {}
+
+
+def register_operator(
+    op: Callable[[Iterable[int]], int],
+    apply: Optional[Callable[[int, int], int]] = None,
+    inverse: Optional[Callable[[int, int], Optional[int]]] = None,
+    monotonic: bool = False,
+) -> None:
+    OPERATORS[op] = OperatorInfo(
+        apply or (lambda l, r: op((l, r))), inverse, monotonic
+    )
+
+
+register_operator(sum, operator.add, subtract, monotonic=True)
+register_operator(math.prod, operator.mul, divide, monotonic=True)
+register_operator(concatenate, concatenate_pair, strip_suffix, monotonic=True)
+
+
+def solve_backwards(equation: Equation, operators: Operators) -> bool:
+    """
+    Peels operands off the end of the equation by undoing each operator,
+    dropping any branch that cannot be undone. Assumes positive operands.
+    """
+    inverses = [
+        inverse for op in operators if (inverse := OPERATORS[op].inverse)
+    ]
+    assert len(inverses) == len(operators)
+
+    def solve(total: int, k: int) -> bool:
+        if k == 0:
+            return total == equation.nums[0]
+
+        for inverse in inverses:
+            rest = inverse(total, equation.nums[k])
+            if rest is not None and solve(rest, k - 1):
+                return True
+        return False
+
+    return solve(equation.total, len(equation.nums) - 1)
+
+
+def solve_forwards(equation: Equation, operators: Operators) -> bool:
+    """
+    Depth-first over the operators, stopping at the first success. If every
+    operator is monotonic, partial results over the total are cut early.
+    """
+    applies = [OPERATORS[op].apply for op in operators]
+    prune = all(OPERATORS[op].monotonic for op in operators)
+
+    def solve(partial: int, k: int) -> bool:
+        if k == len(equation.nums):
+            return partial == equation.total
+
+        for apply in applies:
+            result = apply(partial, equation.nums[k])
+            if prune and result > equation.total:
+                continue
+            if solve(result, k + 1):
+                return True
+        return False
+
+    return solve(equation.nums[0], 1)
+
+
+def solve_equation(equation: Equation, operators: Operators) -> bool:
+    if all(OPERATORS[op].inverse for op in operators):
+        return solve_backwards(equation, operators)
+    return solve_forwards(equation, operators)
+
+
+def calibrate(equations: Iterable[Equation], operators: Operators) -> int:
+    return sum(
+        equation.total
+        for equation in equations
+        if solve_equation(equation, operators)
+    )
+
+
+def calibrate_parallel(
+    equations: Iterable[Equation],
+    operators: Operators,
+    workers: Optional[int] = None,
+) -> int:
+    """
+    Deals equations, longest first, into the lightest of several chunks per
+    worker, so no chunk is left holding all the long equations
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks: list[list[Equation]] = [[] for _ in range(workers * 4)]
+    loads = [(0, c) for c in range(len(chunks))]
+    for equation in sorted(
+        equations, key=lambda equation: len(equation.nums), reverse=True
+    ):
+        load, c = heapq.heappop(loads)
+        chunks[c].append(equation)
+        heapq.heappush(loads, (load + len(equation.nums), c))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(
+            executor.map(calibrate, chunks, itertools.repeat(operators))
+        )
+
+
 if __name__ == '__main__':
     equations = parse_equations()
 
     print('Day 7, Part 1')
     with timer():
-        result = test_equations(equations, (sum, math.prod))
+        result = calibrate(equations, (sum, math.prod))
     print(f'Result: {result}\n')    # 6083020304036
 
     print('Day 7, Part 2')
     with timer():
-        result = test_equations(equations, (sum, math.prod, concatenate))
+        result = calibrate(equations, (sum, math.prod, concatenate))
     print(f'Result: {result}\n')    # 59002246504791
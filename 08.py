@@ -1,8 +1,10 @@
 from __future__ import annotations
 import itertools
+import math
+import sys
 
 from collections import defaultdict
-from typing import NamedTuple
+from typing import Iterable, NamedTuple
 
 from lib import read_input, timer
 
@@ -107,6 +109,108 @@ def count_unique_antinodes(
     return len(antinodes)
 
 
+def line_steps(start: int, step: int, max_index: int) -> range:
+    """
+    The k for which start + k * step stays within [0, max_index]
+    """
+    if step == 0:
+        return range(-sys.maxsize, sys.maxsize)
+    if step > 0:
+        return range(-(start // step), (max_index - start) // step + 1)
+    return range(-((max_index - start) // -step), start // -step + 1)
+
+
+def resonant_line(a: Pos, b: Pos, max_row: int, max_col: int) -> range:
+    """
+    Flat indices of every cell exactly in line with a and b, stepping by the
+    delta reduced by its gcd so no collinear cell is skipped
+    """
+    cols = max_col + 1
+    delta = b - a
+    g = math.gcd(delta.i, delta.j)
+    step = Pos(delta.i // g, delta.j // g)
+    if step < Pos(0, 0):   # Walk forwards through the flat grid
+        step = Pos(-step.i, -step.j)
+
+    i_steps = line_steps(a.i, step.i, max_row)
+    j_steps = line_steps(a.j, step.j, max_col)
+    first = max(i_steps.start, j_steps.start)
+    count = min(i_steps.stop, j_steps.stop) - first
+
+    stride = step.i * cols + step.j
+    start = (a.i + first * step.i) * cols + a.j + first * step.j
+    return range(start, start + count * stride, stride)
+
+
+def count_unique_antinodes_bitmap(
+    satellite_positions: dict[str, list[Pos]],
+    max_row: int,
+    max_col: int,
+    resonant: bool = False,
+) -> int:
+    cols = max_col + 1
+    antinodes = bytearray((max_row + 1) * cols)
+    for _satellite, positions in satellite_positions.items():
+        for a, b in itertools.combinations(positions, 2):
+            if resonant:
+                line = resonant_line(a, b, max_row, max_col)
+                marks = b'\x01' * len(line)
+                antinodes[line.start : line.stop : line.step] = marks
+                continue
+
+            for pos in calculate_pair_antinodes(a, b, max_row, max_col):
+                antinodes[pos.i * cols + pos.j] = 1
+
+    return antinodes.count(1)
+
+
+class AntinodeTracker:
+    """
+    Keeps, per cell, how many antenna pairs put an antinode there, so adding
+    or removing an antenna only revisits the pairs it belongs to
+    """
+
+    def __init__(self, max_row: int, max_col: int, resonant: bool = False):
+        self.max_row = max_row
+        self.max_col = max_col
+        self.resonant = resonant
+        self.antennas: dict[str, list[Pos]] = defaultdict(list)
+        self._pair_counts = [0] * ((max_row + 1) * (max_col + 1))
+        self._unique = 0
+
+    def __len__(self) -> int:
+        return self._unique
+
+    def _pair_cells(self, a: Pos, b: Pos) -> Iterable[int]:
+        if self.resonant:
+            return resonant_line(a, b, self.max_row, self.max_col)
+        return (
+            pos.i * (self.max_col + 1) + pos.j
+            for pos in calculate_pair_antinodes(
+                a, b, self.max_row, self.max_col
+            )
+        )
+
+    def add_antenna(self, frequency: str, pos: Pos) -> None:
+        if pos in self.antennas[frequency]:
+            raise ValueError(f'{frequency} antenna already at {pos}')
+
+        for other in self.antennas[frequency]:
+            for cell in self._pair_cells(other, pos):
+                self._pair_counts[cell] += 1
+                if self._pair_counts[cell] == 1:
+                    self._unique += 1
+        self.antennas[frequency].append(pos)
+
+    def remove_antenna(self, frequency: str, pos: Pos) -> None:
+        self.antennas[frequency].remove(pos)
+        for other in self.antennas[frequency]:
+            for cell in self._pair_cells(other, pos):
+                self._pair_counts[cell] -= 1
+                if self._pair_counts[cell] == 0:
+                    self._unique -= 1
+
+
 if __name__ == '__main__':
     map = parse_map()
     satellite_positions = get_satellite_positions(map)
@@ -1,10 +1,8 @@
 from __future__ import annotations
-import array
-import bisect
-import copy
+import heapq
 
 from collections import deque
-from typing import NamedTuple, NewType
+from typing import Iterable, NamedTuple
 
 from lib import read_input, timer
 
@@ -20,11 +18,7 @@ class Block(NamedTuple):
         return self.loc < other.loc
 
 
-Disk = NewType('Disk', array.array[int])
-
-
 class DiskMap(NamedTuple):
-    disk: Disk
     files: list[Block]
     free: deque[Block]
 
@@ -39,122 +33,149 @@ def dense_disk_map_size(dense_disk_map: list[int]) -> int:
 
 
 def read_dense_disk_map(dense_disk_map: list[int]) -> DiskMap:
-    disk: Disk = Disk(array.array('h', []))
     files: list[Block] = []
     free_spaces: deque[Block] = deque()
 
+    next_loc = 0
     for i, size in enumerate(dense_disk_map):
-        next_loc = len(disk)
         if i % 2 == 0:   # File
             file_id = i // 2
             files.append(Block(file_id, next_loc, size))
-            disk.extend([file_id] * size)
 
         elif i % 2 == 1 and size:   # Free space
             free_spaces.append(Block(-1, next_loc, size))
-            disk.extend([-1] * size)
+
+        next_loc += size
 
     assert all(block.size > 0 for block in files)
     assert all(block.size > 0 for block in free_spaces)
 
-    return DiskMap(disk, files, free_spaces)
+    return DiskMap(files, free_spaces)
 
 
 def compact_disk_map(disk_map: DiskMap) -> DiskMap:
-    while disk_map.free:
-        last_file = disk_map.files[-1]
-        file_size_left = last_file.size
-
-        while file_size_left and disk_map.free:
-            next_free = disk_map.free[0]
-            free_start = next_free.loc
-            free_end = min(
-                free_start + file_size_left,
-                free_start + next_free.size,
+    files = list(disk_map.files)
+    free = deque(disk_map.free)
+    moved_files: list[Block] = []
+
+    while files and free and free[0].loc < files[-1].loc:
+        last_file = files[-1]
+        next_free = free[0]
+        file_size_moved = min(last_file.size, next_free.size)
+        moved_files.append(Block(last_file.id, next_free.loc, file_size_moved))
+
+        free_size_left = next_free.size - file_size_moved
+        if not free_size_left:
+            free.popleft()
+        else:
+            free[0] = Block(
+                -1, next_free.loc + file_size_moved, free_size_left
             )
-            file_size_moved = free_end - free_start
-            file_size_left -= file_size_moved
-            free_size_left = next_free.size - file_size_moved
 
-            disk_map.disk[free_start:free_end] = array.array(
-                'h', [last_file.id] * file_size_moved
-            )
-            del disk_map.disk[last_file.loc + file_size_left :]
-
-            if not free_size_left:
-                disk_map.free.popleft()
-            else:
-                disk_map.free[0] = Block(-1, free_end, free_size_left)
-
-            if not file_size_left:
-                disk_map.files.pop()
-                if (
-                    disk_map.free
-                    and disk_map.files[-1].loc < disk_map.free[-1].loc
-                ):
-                    disk_map.free.pop()
-            else:
-                disk_map.files[-1] = Block(
-                    last_file.id, last_file.loc, file_size_left
-                )
-
-            new_file_block = Block(last_file.id, free_start, file_size_moved)
-            disk_map.files.insert(
-                bisect.bisect_right(disk_map.files, new_file_block),
-                new_file_block,
-            )
+        file_size_left = last_file.size - file_size_moved
+        if not file_size_left:
+            files.pop()
+        else:
+            files[-1] = Block(last_file.id, last_file.loc, file_size_left)
 
-    return disk_map
+    return DiskMap(sorted(files + moved_files), deque())
 
 
 def compact_disk_map_unfragmented(disk_map: DiskMap) -> DiskMap:
-    compacted_files = copy.copy(disk_map.files)
+    """
+    Free spans are kept in one min-heap of locations per span size, so the
+    leftmost span that fits a file is the smallest top among the heaps of
+    sizes at least as big as the file
+    """
+    max_size = max((free.size for free in disk_map.free), default=0)
+    free_by_size: list[list[int]] = [[] for _ in range(max_size + 1)]
+    for free in disk_map.free:
+        free_by_size[free.size].append(free.loc)
+    for locs in free_by_size:
+        heapq.heapify(locs)
+
+    compacted_files: list[Block] = []
     for file in reversed(disk_map.files):
-        for i, free in enumerate(disk_map.free):
-            if free.loc > file.loc:
-                break
-
-            if free.size >= file.size:
-                free_start = free.loc
-                free_end = free_start + file.size
-
-                disk_map.disk[free_start:free_end] = array.array(
-                    'h', [file.id] * file.size
-                )
-                disk_map.disk[file.loc : file.loc + file.size] = array.array(
-                    'h', [-1] * file.size
-                )
-
-                old_file_block_index = bisect.bisect_left(compacted_files, file)
-                del compacted_files[old_file_block_index]
-
-                compacted_file_block = Block(file.id, free_start, file.size)
-                compacted_files.insert(
-                    bisect.bisect_right(compacted_files, compacted_file_block),
-                    compacted_file_block,
-                )
-
-                free_size_left = free.size - file.size
-                if not free_size_left:
-                    del disk_map.free[i]
-                else:
-                    disk_map.free[i] = Block(
-                        -1, free_start + file.size, free_size_left
-                    )
-
-                break
-
-    return DiskMap(
-        disk_map.disk,
-        compacted_files,
-        disk_map.free,
+        best_size = 0
+        for size in range(file.size, max_size + 1):
+            locs = free_by_size[size]
+            if (
+                locs
+                and locs[0] < file.loc
+                and (not best_size or locs[0] < free_by_size[best_size][0])
+            ):
+                best_size = size
+
+        if not best_size:
+            compacted_files.append(file)
+            continue
+
+        free_start = heapq.heappop(free_by_size[best_size])
+        free_end = free_start + file.size
+        compacted_files.append(Block(file.id, free_start, file.size))
+
+        free_size_left = best_size - file.size
+        if free_size_left:
+            heapq.heappush(free_by_size[free_size_left], free_end)
+
+    compacted_files.sort()
+    free_spaces = sorted(
+        Block(-1, loc, size)
+        for size, locs in enumerate(free_by_size)
+        for loc in locs
     )
 
+    return DiskMap(compacted_files, deque(free_spaces))
 
-def disk_checksum(disk: Disk) -> int:
-    return sum(
-        [idx * file_id for idx, file_id in enumerate(disk) if file_id >= 0]
-    )
+
+def location_sum(loc: int, size: int) -> int:
+    return size * (2 * loc + size - 1) // 2
+
+
+def disk_checksum(files: Iterable[Block]) -> int:
+    """
+    Each file contributes its id times the sum of its block locations, an
+    arithmetic series
+    """
+    return sum(file.id * location_sum(file.loc, file.size) for file in files)
+
+
+def compacted_disk_checksum(dense_disk_map: list[int]) -> int:
+    """
+    Checksum of compact_disk_map in one pass over the dense map, filling
+    free space from the left with blocks taken from the right
+    """
+    left = 0
+    right = len(dense_disk_map) - 1
+    right -= right % 2   # Skip trailing free space
+    right_size_left = dense_disk_map[right] if right >= 0 else 0
+
+    checksum = 0
+    loc = 0
+    while left < right:
+        if left % 2 == 0:   # File that stays put
+            size = dense_disk_map[left]
+            checksum += left // 2 * location_sum(loc, size)
+            loc += size
+
+        else:   # Free space, filled from the file on the right
+            free_size_left = dense_disk_map[left]
+            while free_size_left and left < right:
+                size = min(free_size_left, right_size_left)
+                checksum += right // 2 * location_sum(loc, size)
+                loc += size
+                free_size_left -= size
+                right_size_left -= size
+                if not right_size_left:
+                    right -= 2
+                    right_size_left = dense_disk_map[right]
+
+        left += 1
+
+    if left == right:   # What is left of the last file moved into place
+        checksum += right // 2 * location_sum(loc, right_size_left)
+
+    return checksum
 
 
 if __name__ == '__main__':
@@ -162,14 +183,12 @@ if __name__ == '__main__':
 
     print('Day 9, Part 1')
     with timer():
-        disk_map = read_dense_disk_map(dense_disk_map)
-        compacted_disk_map = compact_disk_map(disk_map)
-        result = disk_checksum(compacted_disk_map.disk)
+        result = compacted_disk_checksum(dense_disk_map)
     print(f'Result: {result}\n')    # 6421128769094
 
     print('Day 9, Part 2')
     with timer():
         disk_map = read_dense_disk_map(dense_disk_map)
         compacted_disk_map = compact_disk_map_unfragmented(disk_map)
-        result = disk_checksum(compacted_disk_map.disk)
+        result = disk_checksum(compacted_disk_map.files)
     print(f'Result: {result}\n')    # 6448168620520
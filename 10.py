@@ -1,6 +1,14 @@
 from __future__ import annotations
+import heapq
 
-from typing import Callable, NamedTuple, NewType, Optional, TypeAliasType
+from typing import (
+    Callable,
+    NamedTuple,
+    NewType,
+    Optional,
+    Tuple,
+    TypeAliasType,
+)
 
 from lib import read_input, timer
 
@@ -62,6 +70,140 @@ def score_trailheads(trail_map: TrailMap, score: Scorer) -> int:
     return total
 
 
+class TrailCounts(NamedTuple):
+    paths: list[int]   # Distinct trails from each cell up to any summit
+    summits: list[int]   # Bitset of the summits reachable from each cell
+
+
+def count_trails(trail_map: TrailMap) -> TrailCounts:
+    """
+    Fills in counts one height at a time from the summits down, so each
+    cell is only visited once. Cells are indexed i * cols + j.
+    """
+    ROWS = len(trail_map)
+    COLS = len(trail_map[0])
+
+    layers: list[list[int]] = [[] for _ in range(10)]
+    for i, row in enumerate(trail_map):
+        for j, height in enumerate(row):
+            layers[height].append(i * COLS + j)
+
+    paths = [0] * (ROWS * COLS)
+    summits = [0] * (ROWS * COLS)
+    for bit, cell in enumerate(layers[9]):
+        paths[cell] = 1
+        summits[cell] = 1 << bit
+
+    for height in range(8, -1, -1):
+        for cell in layers[height]:
+            i, j = divmod(cell, COLS)
+            for ni, nj in ((i, j + 1), (i, j - 1), (i + 1, j), (i - 1, j)):
+                if (
+                    0 <= ni < ROWS
+                    and 0 <= nj < COLS
+                    and trail_map[ni][nj] == height + 1
+                ):
+                    paths[cell] += paths[ni * COLS + nj]
+                    summits[cell] |= summits[ni * COLS + nj]
+
+    return TrailCounts(paths, summits)
+
+
+def score_and_rate_trailheads(trail_map: TrailMap) -> Tuple[int, int]:
+    counts = count_trails(trail_map)
+    COLS = len(trail_map[0])
+
+    score = 0
+    rating = 0
+    for i, row in enumerate(trail_map):
+        for j, height in enumerate(row):
+            if height == 0:
+                score += counts.summits[i * COLS + j].bit_count()
+                rating += counts.paths[i * COLS + j]
+    return score, rating
+
+
+class TrailIndex:
+    """
+    Per-cell trail counts kept up to date across height edits. Summit bits
+    are cell indices, so they stay put when other cells change.
+    """
+
+    def __init__(self, trail_map: TrailMap):
+        self.trail_map = TrailMap([list(row) for row in trail_map])
+        self.rows = len(trail_map)
+        self.cols = len(trail_map[0])
+        self.paths = [0] * (self.rows * self.cols)
+        self.summits = [0] * (self.rows * self.cols)
+
+        cells = sorted(
+            range(self.rows * self.cols), key=self._height, reverse=True
+        )
+        for cell in cells:
+            self._recount(cell)
+
+    def _height(self, cell: int) -> int:
+        i, j = divmod(cell, self.cols)
+        return self.trail_map[i][j]
+
+    def _neighbours(self, cell: int, height: int) -> list[int]:
+        i, j = divmod(cell, self.cols)
+        return [
+            ni * self.cols + nj
+            for ni, nj in ((i, j + 1), (i, j - 1), (i + 1, j), (i - 1, j))
+            if 0 <= ni < self.rows
+            and 0 <= nj < self.cols
+            and self.trail_map[ni][nj] == height
+        ]
+
+    def _recount(self, cell: int) -> bool:
+        """
+        Recomputes a cell from the cells one step up, which must already be
+        current. Returns whether its counts changed.
+        """
+        height = self._height(cell)
+        if height == 9:
+            paths, summits = 1, 1 << cell
+        else:
+            paths, summits = 0, 0
+            for up in self._neighbours(cell, height + 1):
+                paths += self.paths[up]
+                summits |= self.summits[up]
+
+        changed = (paths, summits) != (self.paths[cell], self.summits[cell])
+        self.paths[cell] = paths
+        self.summits[cell] = summits
+        return changed
+
+    def score(self, pos: Pos) -> int:
+        return self.summits[pos.i * self.cols + pos.j].bit_count()
+
+    def rating(self, pos: Pos) -> int:
+        return self.paths[pos.i * self.cols + pos.j]
+
+    def set_height(self, pos: Pos, height: int) -> None:
+        """
+        Only the edited cell and the cells that climb into it, directly or
+        through other changed cells, are recounted, highest first
+        """
+        cell = pos.i * self.cols + pos.j
+        old_height = self._height(cell)
+        self.trail_map[pos.i][pos.j] = Tile(height)
+
+        dirty = {cell}
+        dirty.update(self._neighbours(cell, old_height - 1))
+        dirty.update(self._neighbours(cell, height - 1))
+        queue = [(-self._height(d), d) for d in dirty]
+        heapq.heapify(queue)
+        while queue:
+            _, d = heapq.heappop(queue)
+            if self._recount(d):
+                for down in self._neighbours(d, self._height(d) - 1):
+                    if down not in dirty:
+                        dirty.add(down)
+                        heapq.heappush(queue, (-self._height(down), down))
+
+
 if __name__ == '__main__':
     trail_map = parse_trail_map()
 
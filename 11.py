@@ -1,7 +1,9 @@
 from __future__ import annotations
+import bisect
+import functools
 
 from collections import Counter
-from typing import TypeAliasType
+from typing import Tuple, TypeAliasType
 
 from lib import read_input, timer
 
@@ -13,23 +15,39 @@ def parse_stones() -> Stones:
     return Counter(int(n) for line in read_input(11) for n in line.split(' '))
 
 
+POWERS_OF_TEN: list[int] = [10**k for k in range(20)]
+
+
+def digit_count(stone: int) -> int:
+    while stone >= POWERS_OF_TEN[-1]:
+        POWERS_OF_TEN.append(POWERS_OF_TEN[-1] * 10)
+    return bisect.bisect_right(POWERS_OF_TEN, stone)
+
+
+@functools.lru_cache(maxsize=1 << 14)
+def stone_children(stone: int) -> Tuple[int, ...]:
+    if stone == 0:
+        return (1,)
+
+    digits = digit_count(stone)
+    if digits % 2 == 0:
+        return divmod(stone, POWERS_OF_TEN[digits // 2])
+
+    return (stone * 2024,)
+
+
+def transition_hit_rate() -> float:
+    info = stone_children.cache_info()
+    lookups = info.hits + info.misses
+    return info.hits / lookups if lookups else 0.0
+
+
 def blink_once(stones: Stones) -> Stones:
     next_stones: Stones = Counter()
 
     for stone, count in stones.items():
-        stone_text = str(stone)
-        if stone == 0:
-            next_stones[1] += count
-
-        elif len(stone_text) % 2 == 0:
-            midpoint = len(stone_text) // 2
-            left = stone_text[:midpoint]
-            right = stone_text[midpoint:]
-            next_stones[int(left)] += count
-            next_stones[int(right)] += count
-
-        else:
-            next_stones[stone * 2024] += count
+        for child in stone_children(stone):
+            next_stones[child] += count
 
     return next_stones
 